@@ -109,6 +109,19 @@ class DepthChartPlotter:
         self.ax.xlim_prev = None
         self.ax.ylim_prev = None
 
+        # persistent artists, updated in place every frame instead of clearing and redrawing the axes
+        self.bid_line, = self.ax.step([], [], color="green", label="bids")
+        self.ask_line, = self.ax.step([], [], color="red", label="asks")
+        self.bid_fill = None
+        self.ask_fill = None
+        self.legend = None
+        self.misc_text = []
+
+        self.ax.spines['bottom'].set_position('zero')
+        self.ax.set_xlabel('Price')
+        self.ax.set_ylabel('Quantity')
+        self.fig.suptitle(f"Market Depth - {self.title}")
+
         logger.debug("DepthChartPlotter initialized.")
 
     def close(self):
@@ -232,30 +245,19 @@ class DepthChartPlotter:
 
             # final formatting  ---------------------------------------------------------------
 
-            if self.ax.lines:  # clear previously drawn lines
-                self.ax.cla()
-
             # step functions for bids and asks
-            if bid_prices is not None:
-                self.ax.step(bid_prices, bid_depth, color="green", label="bids")
-                plt.fill_between(bid_prices, bid_depth, facecolor="green", step='pre', alpha=0.2)
+            self.bid_fill = self.update_side(self.bid_line, self.bid_fill, bid_prices, bid_depth, "green")
+            self.ask_fill = self.update_side(self.ask_line, self.ask_fill, ask_prices, ask_depth, "red")
 
-            if ask_prices is not None:
-                self.ax.step(ask_prices, ask_depth, color="red", label="asks")
-                plt.fill_between(ask_prices, ask_depth, facecolor="red", step='pre', alpha=0.2)
-
-            if best_bid is not None and best_ask is not None:
-                self.ax.legend(loc='upper right')  # condition prevents "No artist" error msg from printing
+            if best_bid is not None and best_ask is not None and self.legend is None:
+                self.legend = self.ax.legend(loc='upper right')  # condition prevents "No artist" error msg from printing
 
+            if x_min is None or x_max is None:  # fall back to autoscaling for whichever side isn't loaded yet
+                self.ax.relim()
+                self.ax.autoscale(enable=True)
             self.ax.set_xlim(left=x_min, right=x_max)
             self.ax.set_ylim(bottom=y_min, top=y_max)
 
-            self.ax.spines['bottom'].set_position('zero')
-
-            self.ax.set_xlabel('Price')
-            self.ax.set_ylabel('Quantity')
-
-            self.fig.suptitle(f"Market Depth - {self.title}")
             self.ax.set_title(f"latest timestamp: {self.timestamp}")
 
             display_text_upper_left = (
@@ -283,13 +285,26 @@ class DepthChartPlotter:
             plt.pause(0.01)
             pass
 
+    def update_side(self, line, fill, prices, depth, color):
+        """Point a side's step line at new data and replace its fill. Returns the new fill (or None)."""
+        if fill is not None:
+            fill.remove()
+        if prices is None:
+            line.set_data([], [])
+            return None
+        line.set_data(prices, depth)
+        return self.ax.fill_between(prices, depth, facecolor=color, step='pre', alpha=0.2)
+
     def fill_misc_text(self, display_text, x, y, d):
-        for i in range(len(display_text)):
-            self.ax.text(
-                x, y + i*d, display_text[i],
+        # create text artists on first use, then only swap their strings
+        for i in range(len(self.misc_text), len(display_text)):
+            self.misc_text.append(self.ax.text(
+                x, y + i*d, '',
                 horizontalalignment='left', verticalalignment='center', size='smaller',
                 transform=self.ax.transAxes
-            )
+            ))
+        for text, line in zip(self.misc_text, display_text):
+            text.set_text(line)
 
     def get_data(self):
         while True:
@@ -320,17 +335,14 @@ class DepthChartPlotter:
         if len(bid_levels) > 0:
             # bid_levels_reversed = bid_levels[::-1]
             # bid_prices, bid_sizes, bid_depth = list(zip(*bid_levels_reversed))
-            bid_prices, bid_sizes, bid_depth = np.array(bid_levels).transpose()
-
-            bid_prices = bid_prices[::-1]
-            bid_sizes = bid_sizes[::-1]
-            bid_depth = bid_depth[::-1]
+            # bids arrive best-first; flip rows once so prices ascend, then split columns (views, no copies)
+            bid_prices, bid_sizes, bid_depth = np.array(bid_levels, dtype=np.float64)[::-1].transpose()
 
             # print("bid_prices, bid_depth, bid_liquidity")
             # print(bid_prices, bid_sizes, bid_depth)
 
         if len(ask_levels) > 0:
-            ask_prices, ask_sizes, ask_depth = np.array(ask_levels).transpose()
+            ask_prices, ask_sizes, ask_depth = np.array(ask_levels, dtype=np.float64).transpose()
 
             # print("ask_prices, ask_depth, ask_liquidity")
             # print(ask_prices, ask_sizes, ask_depth)
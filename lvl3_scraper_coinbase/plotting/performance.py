@@ -27,6 +27,8 @@ if sys.platform == 'darwin':
 else:
     from multiprocessing import Queue
 
+_print_lock = Lock()  # shared by every print_data_readable call, a new Lock per call wouldn't serialize anything
+
 
 def initialize_plotter(queue: Queue, *args, **kwargs):
     """Function to initialize and start performance plotter, required for multiprocessing."""
@@ -363,8 +365,7 @@ class PerformancePlotter:
 
         pp = pprint.PrettyPrinter(indent=4)
 
-        print_lock = Lock()
-        with print_lock:
+        with _print_lock:
             pp.pprint(data_as_dict)
 
 
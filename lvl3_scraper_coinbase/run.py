@@ -17,6 +17,7 @@ from api_coinbase_pro import CoinbaseProAPI
 from websockets_coinbase import WebsocketClient, WebsocketClientHandler
 from rust_orderbook_builder import OrderbookBuilder, OrderbookSnapshotHandler
 from tools.GracefulKiller import GracefulKiller
+from tools.deque_queue import DequeQueue
 from tools.timer import Timer
 from tools.configure_loguru import configure_logger
 import plotting.depth_chart_mpl_v2 as dpth
@@ -63,12 +64,16 @@ BUILD_ORDERBOOK = True
 BUILD_MATCHES = True
 BUILD_CANDLES = True
 PLOT_DEPTH_CHART = True
+DEPTH_CHART_LEVELS = None  # levels per side sent to the depth chart (None = whole book)
 
 CANDLE_FREQUENCY = '1T'  # 1 min
 # FREQUENCIES = ['1T', '5T', '15T', '1H', '4H', '1D']
 SAVE_MATCHES = False
 SAVE_CANDLES = False
 SAVE_INTERVAL = 360
+SAVE_ROWS = None  # also save once this many rows are unsaved (None = save on SAVE_INTERVAL only)
+SAVE_BUFFER_SIZE = 1 << 20  # bytes buffered per output file before the OS sees a write, rows are on disk by close
+# set to False for long runs: rows are dropped from memory once saved, so memory stays bounded by what's unsaved
 KEEP_MATCHES_IN_MEMORY = True
 KEEP_CANDLES_IN_MEMORY = True
 
@@ -85,6 +90,7 @@ EXCHANGE = "Coinbase"
 ENDPOINT = 'wss://ws-feed.exchange.coinbase.com'
 MARKET = 'ETH-USD'
 CHANNEL = 'full'
+COMPRESSION = "deflate"  # permessage-deflate: less bandwidth for some inflate CPU per frame, None to disable
 # MARKETS = ('BTC-USD', 'ETH-USD', 'DOGE-USD', 'SHIB-USD', 'SOL-USD',
 #           'AVAX-USD', 'UNI-USD', 'SNX-USD', 'CRV-USD', 'AAVE-USD', 'YFI-USD')
 
@@ -93,7 +99,7 @@ CHANNEL = 'full'
 
 def skip_finish_processing(_data_qsize_cutoff: int):
     title = "Orderbook Builder wrapping up..."
-    msg = f"More than {_data_qsize_cutoff:,} pending items in orderbook queue.\n"
+    msg = f"More than {_data_qsize_cutoff:,} pending msgs in orderbook queue.\n"
     msg += "Skip remaining items?"
     return easygui.ynbox(msg, title)
 
@@ -119,7 +125,7 @@ if __name__ == '__main__':
         OUTPUT_DIRECTORY.mkdir(parents=True, exist_ok=True)
 
     # main queue between websocket client and orderbook builder
-    data_queue = queue.Queue()
+    data_queue = DequeQueue()
 
     # start depth chart in separate process
     depth_chart_queue = None
@@ -183,6 +189,7 @@ if __name__ == '__main__':
                 exchange=EXCHANGE,
                 data_queue=data_queue,
                 endpoint=ENDPOINT,
+                compression=COMPRESSION,
                 save_feed=SAVE_FEED,
                 output_folder=OUTPUT_DIRECTORY,
                 module_timer=module_timer,
@@ -234,12 +241,15 @@ if __name__ == '__main__':
             queue=data_queue,
             snapshot_order_count=snapshot_order_count,
             output_queue=depth_chart_queue,
+            output_depth=DEPTH_CHART_LEVELS,
             item_display_flags=ITEM_DISPLAY_FLAGS,
             build_matches=BUILD_MATCHES,
             build_candles=BUILD_CANDLES,
             save_matches=SAVE_MATCHES,
             save_candles=SAVE_CANDLES,
             save_interval=SAVE_INTERVAL,
+            save_rows=SAVE_ROWS,
+            save_buffer_size=SAVE_BUFFER_SIZE,
             keep_matches_in_memory=KEEP_MATCHES_IN_MEMORY,
             keep_candles_in_memory=KEEP_CANDLES_IN_MEMORY,
             load_feed_filepath=load_feed_filepath,
@@ -255,7 +265,7 @@ if __name__ == '__main__':
         orderbook_builder.thread.start()
 
         while orderbook_builder.queue_mode == "snapshot":
-            time.sleep(0.1)
+            killer.event.wait(0.1)
             if killer.kill_now:
                 orderbook_builder.stop()
 
@@ -280,7 +290,7 @@ if __name__ == '__main__':
         if orderbook_builder.queue_mode == "stop":
             killer.kill_now = True
 
-        time.sleep(1)
+        killer.event.wait(1)  # returns as soon as a stop signal arrives
 
     if ws_handler is not None:
         ws_handler.kill_all()
@@ -288,7 +298,7 @@ if __name__ == '__main__':
     if orderbook_builder is not None:
         orderbook_builder.finish()
 
-        data_qsize_cutoff = 10000
+        data_qsize_cutoff = 10000  # msgs, DequeQueue.qsize() counts each msg in a batch
         if data_queue.qsize() > data_qsize_cutoff:
             result = skip_finish_processing(data_qsize_cutoff)
             if result:
@@ -311,7 +321,7 @@ if __name__ == '__main__':
         logger.info(f"Remaining data queue size: {data_queue.qsize()}")
         if data_queue.qsize() != 0:
             logger.warning("Orderbook builder did not finish processing the queue! Clearing all queues now...")
-            data_queue.queue.clear()
+            data_queue.clear()
             logger.info(f"Queues cleared.")
 
     # wait for stats chart process to stop
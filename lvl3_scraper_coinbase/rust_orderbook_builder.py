@@ -1,6 +1,6 @@
-import json
 import gzip
 import threading
+import time
 from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -8,12 +8,13 @@ import queue as q
 from threading import Thread
 from itertools import islice, cycle
 import copy
+from functools import partial
 
+import orjson
 from loguru import logger
-from termcolor import colored
 
 from rust_orderbook import LimitOrderbook, Order, Side, Submit
-from tools.helper_tools import s_print
+from tools.helper_tools import s_print, parse_timestamp, colored
 from tools.timer import Timer
 from tools.run_once_per_interval import run_once_per_interval, run_once
 from worker_dataframes import MatchDataFrame, CandleDataFrame
@@ -26,6 +27,16 @@ else:
     import multiprocessing as mp
 
 
+# Rust Enum must be handled uniquely; map feed sides once instead of per item
+SIDES = {"buy": Side.Bids, "sell": Side.Asks}
+
+# item display
+DIVIDER = "-" * 72
+OPEN_LABEL = colored("OPEN", 'yellow')
+CLOSE_LABEL = colored("CLOSE", 'magenta')
+CHANGE_LABEL = colored("CHANGE", 'cyan')
+
+
 class JustContinueException(Exception):
     pass
 
@@ -54,8 +65,8 @@ class OrderbookSnapshotHandler:
     @staticmethod
     def load_orderbook_snapshot(snapshot_filepath: Path):
         logger.debug(f"Loading snapshot from {snapshot_filepath.name}")
-        with gzip.open(snapshot_filepath, 'rt', encoding='UTF-8') as f:
-            snapshot = json.loads(f.read())
+        with gzip.open(snapshot_filepath, 'rb') as f:
+            snapshot = orjson.loads(f.read())
         return snapshot
 
     @staticmethod
@@ -70,8 +81,8 @@ class OrderbookSnapshotHandler:
         filename_timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
         snapshot_filename = f"{exchange}_orderbook_snapshot_{market}_{sequence}_{filename_timestamp}.json.gz"
         snapshot_filepath = Path.cwd() / folder / snapshot_filename
-        with gzip.open(snapshot_filepath, 'wt', encoding='UTF-8') as f:
-            f.write(json.dumps(orderbook_snapshot))
+        with gzip.open(snapshot_filepath, 'wb') as f:
+            f.write(orjson.dumps(orderbook_snapshot))
         logger.debug(f"Snapshot saved to {snapshot_filename}.")
 
     def load_snapshot_to_queue(self, _queue, orderbook_snapshot, depth) -> None:
@@ -127,6 +138,7 @@ class OrderbookBuilder:
         self.__save_matches = kwargs.get("save_matches", False)  # bool
         self.__save_candles = kwargs.get("save_candles", False)  # bool
         self.__output_folder = kwargs.get("output_folder", "data")  # str
+        self.__save_buffer_size = kwargs.get("save_buffer_size", 1 << 20)  # int (bytes), output file write buffer
         self.__keep_matches_in_memory = kwargs.get("keep_matches_in_memory", True)
         self.__keep_candles_in_memory = kwargs.get("keep_candles_in_memory", True)
 
@@ -149,6 +161,17 @@ class OrderbookBuilder:
         if isinstance(item_display_flags, dict):
             self.__item_display_flags.update(item_display_flags)
 
+        # item type -> handler, called with (item, output_data)
+        self.__item_handlers = {
+            "subscriptions": self.__on_subscriptions,
+            "received": self.__on_received,
+            "open": self.__on_open,
+            "snapshot": self.__on_open,
+            "done": self.__on_done,
+            "change": self.__on_change,
+            "match": self.__on_match,
+        }
+
         if self.module_timer.get_start_time() is None:
             self.module_timer.start()
         module_timestamp = self.module_timer.get_start_time(_format="datetime").strftime("%Y%m%d-%H%M%S")
@@ -158,7 +181,8 @@ class OrderbookBuilder:
             exchange=self.__exchange,
             market=self.__market,
             timestamp=module_timestamp,
-            output_folder=self.__output_folder
+            output_folder=self.__output_folder,
+            buffer_size=self.__save_buffer_size
         )
 
         self.__build_candles = kwargs.get("build_candles", False)  # bool
@@ -170,10 +194,21 @@ class OrderbookBuilder:
                 market=self.__market,
                 frequency="1T",
                 timestamp=module_timestamp,
-                output_folder=self.__output_folder
+                output_folder=self.__output_folder,
+                buffer_size=self.__save_buffer_size
             )
 
+        # bind the per-match calls once, flags don't change after __init__
+        self.__process_match = partial(
+            self.matches.process_item,
+            display_match=self.__item_display_flags["match"],
+            store_in_df=self.__build_matches
+        )
+        self.__process_candle = self.candles.process_item if self.__build_candles else None
+
         self._save_interval = kwargs.get("save_interval", 360)  # float (seconds)
+        self.__save_rows = kwargs.get("save_rows", None)  # int, also save once this many rows are unsaved
+        self.__next_save = 0.0  # monotonic deadline of the next timed save, pushed out by every save
         self.__save_timer = Timer()
 
         # data structures
@@ -192,6 +227,10 @@ class OrderbookBuilder:
         self.latest_timestamp = None
 
         self.output_queue = kwargs.get("output_queue", None)  # mp.queue
+        self.output_depth = kwargs.get("output_depth", None)  # int, levels per side sent to output queue (None = all)
+        self.output_interval = kwargs.get("output_interval", 1 / 30)  # float (seconds), ~ depth chart frame rate
+        self.__next_output = 0.0
+        self.__output_dropped = 0  # snapshots not sent because the output queue was still full
         if self.output_queue is not None:
             assert type(self.output_queue) == type(mp.Queue()), "passed output queue is not a multiprocessing queue!"
         if self.output_queue is not None:
@@ -204,7 +243,8 @@ class OrderbookBuilder:
         self._queue_empty_interval = 60
         self.__queue_stats_timer = Timer()
         self._queue_stats_interval = 60  # seconds
-        self.__queue_stats = defaultdict(list)
+        self.__queue_stats = defaultdict(lambda: deque(maxlen=1000))  # keep the last 1000 measurements of each stat
+        self.__qsize_sum = 0  # running sum of __queue_stats["queue_sizes"]
         self.__total_queue_items_processed = 0
         self.__total_queue_items_skipped = 0
         self.__prev_qsize = 0
@@ -238,6 +278,7 @@ class OrderbookBuilder:
 
         # main processing thread
         self.thread = Thread(target=self.__process_queue)
+        self.__main_thread_watchdog = Thread(target=self.__watch_main_thread, daemon=True)
 
         # use for running local copies of feeds
         self.__load_feed = False
@@ -271,9 +312,9 @@ class OrderbookBuilder:
         if line != '' and line is not None:
             # logger.debug(f"line = '{line}'")
             try:
-                item = json.loads(line)
+                item = orjson.loads(line)
                 # logger.debug(f"putting item in queue = {item}")
-            except json.decoder.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.critical(f"JSONDecodeError from line '{line}'")
             else:
                 self.queue.put(item)
@@ -294,17 +335,27 @@ class OrderbookBuilder:
             while self.queue_mode != mode:
                 self.__next_queue_mode()
 
+    def __wake(self):
+        """Wake a worker blocked on an empty queue, so it sees the new mode right away.
+        Nothing is enqueued, so no stray item is left behind or counted as skipped.
+        Queues without wake() (queue.Queue) are picked up when the worker's get times out."""
+        if hasattr(self.queue, "wake"):
+            self.queue.wake()
+
     def finish(self):
         self.__skip_to_next_queue_mode("finish")
-        logger.info(f"Wrapping up the queue... Remaining items: {self.queue.qsize()}")
+        logger.info(f"Wrapping up the queue... Remaining msgs: {self.queue.qsize()}")
+        self.__wake()
 
     def stop(self):
         self.__skip_to_next_queue_mode("stop")
         logger.debug(f"Stop called. Skipping any remaining items in queue.")
+        self.__wake()
 
-    def __check_main_thread(self):
-        """Check on main thread and choose next queue mode if main thread broke."""
-        if not threading.main_thread().is_alive():
+    def __watch_main_thread(self):
+        """Block until the main thread exits, and stop the builder if it is still running by then."""
+        threading.main_thread().join()
+        if self.thread.is_alive() and self.queue_mode != "stop":
             logger.critical("Main thread is dead! Wrapping it up...")
             self.stop()
 
@@ -327,8 +378,11 @@ class OrderbookBuilder:
 
     def __clear_queues_and_exit(self):
         if not self.queue.empty():
-            logger.info(f"Queue is not empty. Clearing remaining {self.queue.qsize()} items and exiting thread.")
-            self.queue.queue.clear()
+            logger.info(f"Queue is not empty. Clearing remaining {self.queue.qsize()} msgs and exiting thread.")
+            if hasattr(self.queue, "clear"):  # DequeQueue, resets its msg count along with the items
+                self.queue.clear()
+            else:
+                self.queue.queue.clear()
         else:
             logger.info("Queue is empty. Exiting thread.")
 
@@ -356,34 +410,41 @@ class OrderbookBuilder:
                 self.__total_queue_items_skipped += 1
                 raise JustContinueException
 
-            try:
-                self.__process_item(item, *args, **kwargs)
-            except AttributeError as e:
-                logger.warning(f"Attribute Error: {e} caused by {item}")
+            # websocket clients put msgs in batches
+            if isinstance(item, list):
+                for sub_item in item:
+                    self.__try_process_item(sub_item, *args, **kwargs)
             else:
-                if self.stats_queue is not None:
-                    self.ob_builder_perf.track(timestamp=self.latest_timestamp.timestamp())
-                self.__lob_checked = False
+                self.__try_process_item(item, *args, **kwargs)
 
         except q.Empty as e:
             raise q.Empty
 
+    def __try_process_item(self, item: dict, *args, **kwargs) -> None:
+        try:
+            self.__process_item(item, *args, **kwargs)
+        except AttributeError as e:
+            logger.warning(f"Attribute Error: {e} caused by {item}")
+        else:
+            if self.stats_queue is not None:
+                self.ob_builder_perf.track(timestamp=self.latest_timestamp.timestamp())
+            self.__lob_checked = False
+
     def __process_queue(self) -> None:
         self.__lob_builder_timer.start()
         self.__lob_check_timer.start()
         self.__save_timer.start()
         self.__queue_stats_timer.start()
         self.__queue_empty_timer.start()
+        self.__main_thread_watchdog.start()
         logger.info(
-            f"Orderbook builder starting now in {self.queue_mode} mode. Starting queue size: {self.queue.qsize()} items")
+            f"Orderbook builder starting now in {self.queue_mode} mode. Starting queue size: {self.queue.qsize()} msgs")
 
         while True:
 
             if self.__load_feed and self.queue_mode not in {'finish', 'stop'}:
                 self.__load_queue_with_next()
 
-            self.__check_main_thread()
-
             match self.queue_mode:
 
                 case "snapshot":
@@ -458,40 +519,23 @@ class OrderbookBuilder:
         snapshot = kwargs.get("snapshot", False)
         backfill = kwargs.get("backfill", False)
 
-        item_type, sequence, order_id, \
-        side, size, remaining_size, \
-        old_size, new_size, \
-        price, timestamp, client_oid \
-            = \
-            item.get("type"), item.get("sequence"), item.get("order_id"), \
-            item.get("side"), item.get("size"), item.get("remaining_size"), \
-            item.get("old_size"), item.get("new_size"), \
-            item.get("price"), item.get("time"), item.get("client_oid")
+        item_type, sequence, timestamp = item.get("type"), item.get("sequence"), item.get("time")
 
         try:
-            self.latest_timestamp = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ") \
+            self.latest_timestamp = parse_timestamp(timestamp) \
                 if timestamp is not None else datetime.utcnow()
         except ValueError:
             self.latest_timestamp = str(datetime.utcnow())
 
-        # Rust Enum must be handled uniquely
-        if side == "buy":
-            side = Side.Bids
-        elif side == "sell":
-            side = Side.Asks
-
         if self.__first_sequence is None and sequence is not None:
             self.__log_first_sequence(sequence)
 
         if self.__first_websocket_sequence is None and sequence is not None and not snapshot and not backfill:
             self.__log_first_websocket_sequence(sequence)
 
-        # item validity checks ---------------------------------------------------------
-        valid_sequence, valid_received, valid_open, valid_done, valid_change = True, True, True, True, True
-
         # sequence is invalid if it's None, out of order,
         # or if snapshot is True and the item passed wasn't a snapshot (to sync snapshot with websocket)
-
+        valid_sequence = True
         if sequence is None or \
                 (self.__sequence is not None and sequence <= self.__sequence) or \
                 (snapshot and item_type != "snapshot"):
@@ -504,165 +548,181 @@ class OrderbookBuilder:
             if self.__prev_sequence is not None and self.__sequence != self.__prev_sequence + 1:
                 self.__log_missing_sequences(self.__prev_sequence, self.__sequence)
 
-        match item_type:
-            case "snapshot":
-                valid_sequence = True  # all snapshot items have the same sequence
-                if self.__snapshot_sequence is None:
-                    self.__log_snapshot_sequence(sequence)
-            case "received":
-                if None in [item_type, order_id]:
-                    logger.info(f"Invalid received msg: {item}")
-                    valid_received = False
-            case "open":
-                if None in [item_type, order_id, remaining_size, price]:
-                    logger.info(f"Invalid open msg.")
-                    valid_open = False
-                if side not in [Side.Asks, Side.Bids]:
-                    logger.info(f"Invalid open msg.")
-                    valid_open = False
-            case "done":
-                if None in [item_type, order_id]:
-                    logger.info(f"Invalid done msg.")
-                    valid_done = False
-            case "change":
-                if None in [item_type, order_id, new_size]:
-                    logger.info(f"Invalid change msg.")
-                    valid_change = False
+        if item_type == "snapshot":
+            valid_sequence = True  # all snapshot items have the same sequence
+            if self.__snapshot_sequence is None:
+                self.__log_snapshot_sequence(sequence)
 
         # process items ----------------------------------------------------------------
-        match item_type:
-            case "subscriptions":
-                if self.__item_display_flags[item_type]:
-                    self.display_subscription(item)
-
-            # process received
-            case "received" if valid_received and valid_sequence:
-                if self.__item_display_flags[item_type]:
-                    s_print("------------------------------------------------------------------------")
-                    s_print("RECEIVED", end=' ')
-                    s_print(item)
-
-            # process new orders
-            case "open" | "snapshot" if valid_open and valid_sequence:
-
-                if self.__item_display_flags[item_type]:
-                    s_print("------------------------------------------------------------------------")
-                    s_print(colored("OPEN", 'yellow'), end=' ')
-                    s_print(f"Order -- {side} {remaining_size} units @ {price}", end=' ')
-                    s_print(f"-- order_id = {order_id} -- timestamp: {timestamp}")
-
-                if self.lob is not None:
-
-                    order = Order(
-                        uid=order_id,
-                        side=side,
-                        price=float(price),
-                        size=float(remaining_size),
-                        timestamp=timestamp,
-                    )
-
-                    if hasattr(self, "order_insert_perf"):
-                        self.order_insert_perf.timedelta()  # reset timer
-
-                    self.lob.process(order, Submit.Insert)
-
-                    if hasattr(self, "order_insert_perf"):
-                        self.order_insert_perf.timedelta(log=True)  # log elapsed
-
-                    if output_data:
-                        self.output_data()
-
-            # process order cancels
-            case "done" if valid_done and valid_sequence:
-
-                if self.__item_display_flags[item_type]:
-                    s_print("------------------------------------------------------------------------")
-                    s_print(colored("CLOSE", 'magenta'), end=' ')
-                    s_print(f"Order -- {side} {remaining_size} units @ {price}", end=' ')
-                    s_print(f"-- order_id = {order_id} -- timestamp: {timestamp}")
-
-                if self.lob is not None:
-
-                    order = Order(
-                        uid=order_id,
-                        side=side,
-                        price=None,
-                        size=None,
-                        timestamp=timestamp,
-                    )
-
-                    if hasattr(self, "order_remove_perf"):
-                        self.order_remove_perf.timedelta()  # reset timer
-
-                    self.lob.process(order, Submit.Remove)
-
-                    if hasattr(self, "order_remove_perf"):
-                        self.order_remove_perf.timedelta(log=True)  # log elapsed
-
-                    if output_data:
-                        self.output_data()
-
-            # process order changes
-            case "change" if valid_change and valid_sequence:
-
-                if self.__item_display_flags[item_type]:
-                    s_print("------------------------------------------------------------------------")
-                    s_print(colored("CHANGE", 'cyan'), end=' ')
-                    s_print(f"Order -- {side} {new_size} units @ {price}", end=' ')
-                    s_print(f"-- order_id = {order_id} -- timestamp: {timestamp}")
-
-                if self.lob is not None:
-
-                    order = Order(
-                        uid=order_id,
-                        side=side,
-                        price=None,
-                        size=float(new_size),
-                        timestamp=timestamp,
-                    )
-
-                    self.lob.process(order, Submit.Update)
-
-                    if output_data:
-                        self.output_data()
-
-            # process trades
-            case "match" if valid_sequence:
-                self.matches.process_item(
-                    item,
-                    display_match=self.__item_display_flags[item_type],
-                    store_in_df=self.__build_matches
-                )
-                if self.__build_candles:
-                    self.candles.process_item(item)
-
-            # place items into backfill queue while snapshot is processing
-            # valid_sequence is false when queue mode is snapshot and item_type is not snapshot
-            case _ if not valid_sequence and snapshot:
-                self.__log_backfilling(sequence)
-                self.__backfill_queue.put(item)
-
-            case _ if not valid_sequence:
-                self.__log_invalid_sequence(sequence, item)
-
-            case _:
+        # subscriptions carry no sequence, so they're handled regardless of valid_sequence
+        if valid_sequence or item_type == "subscriptions":
+            handler = self.__item_handlers.get(item_type)
+            if handler is None:
                 logger.critical(f"Below item's type is unhandled!")
                 logger.critical(f"{item}")
                 raise ValueError("Unhandled msg type")
+            handler(item, output_data)
+
+        # place items into backfill queue while snapshot is processing
+        # valid_sequence is false when queue mode is snapshot and item_type is not snapshot
+        elif snapshot:
+            self.__log_backfilling(sequence)
+            self.__backfill_queue.put(item)
+
+        else:
+            self.__log_invalid_sequence(sequence, item)
 
         if backfill and valid_sequence:
             self.__backfill_items_processed += 1
 
+    @staticmethod
+    def __invalid_item(item: dict) -> None:
+        logger.info(f"Invalid {item.get('type')} msg: {item}")
+        raise ValueError("Invalid msg")
+
+    def __on_subscriptions(self, item: dict, output_data: bool) -> None:
+        # one LimitOrderbook and one sequence counter, while Coinbase numbers sequences per product
+        product_ids = {product_id for channel in item.get("channels", []) for product_id in channel.get("product_ids", [])}
+        if len(product_ids) > 1:
+            logger.critical(f"Orderbook builder handles a single market, but the feed is subscribed to {sorted(product_ids)}")
+            raise ValueError("Subscription covers more than one market")
+        if self.__item_display_flags["subscriptions"]:
+            self.display_subscription(item)
+
+    def __on_received(self, item: dict, output_data: bool) -> None:
+        if item.get("order_id") is None:
+            self.__invalid_item(item)
+        if self.__item_display_flags["received"]:
+            s_print(f"{DIVIDER}\nRECEIVED {item}")
+
+    def __on_open(self, item: dict, output_data: bool) -> None:
+        """Process new orders, from the websocket ('open') or from the orderbook snapshot ('snapshot')"""
+        item_type, order_id, remaining_size, price, timestamp = \
+            item["type"], item.get("order_id"), item.get("remaining_size"), item.get("price"), item.get("time")
+        side = SIDES.get(item.get("side"))
+
+        if item_type == "open" and (None in (order_id, remaining_size, price) or side is None):
+            self.__invalid_item(item)
+
+        if self.__item_display_flags[item_type]:
+            s_print(f"{DIVIDER}\n{OPEN_LABEL} Order -- {side} {remaining_size} units @ {price} "
+                    f"-- order_id = {order_id} -- timestamp: {timestamp}")
+
+        lob = self.lob
+        if lob is not None:
+
+            order = Order(
+                uid=order_id,
+                side=side,
+                price=float(price),
+                size=float(remaining_size),
+                timestamp=timestamp,
+            )
+
+            if hasattr(self, "order_insert_perf"):
+                self.order_insert_perf.timedelta()  # reset timer
+
+            lob.process(order, Submit.Insert)
+
+            if hasattr(self, "order_insert_perf"):
+                self.order_insert_perf.timedelta(log=True)  # log elapsed
+
+            if output_data:
+                self.output_data()
+
+    def __on_done(self, item: dict, output_data: bool) -> None:
+        """Process order cancels"""
+        order_id, timestamp = item.get("order_id"), item.get("time")
+        if order_id is None:
+            self.__invalid_item(item)
+
+        side = SIDES.get(item.get("side"))
+
+        if self.__item_display_flags["done"]:
+            s_print(f"{DIVIDER}\n{CLOSE_LABEL} Order -- {side} {item.get('remaining_size')} units @ "
+                    f"{item.get('price')} -- order_id = {order_id} -- timestamp: {timestamp}")
+
+        lob = self.lob
+        if lob is not None:
+
+            order = Order(
+                uid=order_id,
+                side=side,
+                price=None,
+                size=None,
+                timestamp=timestamp,
+            )
+
+            if hasattr(self, "order_remove_perf"):
+                self.order_remove_perf.timedelta()  # reset timer
+
+            lob.process(order, Submit.Remove)
+
+            if hasattr(self, "order_remove_perf"):
+                self.order_remove_perf.timedelta(log=True)  # log elapsed
+
+            if output_data:
+                self.output_data()
+
+    def __on_change(self, item: dict, output_data: bool) -> None:
+        """Process order changes"""
+        order_id, new_size, timestamp = item.get("order_id"), item.get("new_size"), item.get("time")
+        if None in (order_id, new_size):
+            self.__invalid_item(item)
+
+        side = SIDES.get(item.get("side"))
+
+        if self.__item_display_flags["change"]:
+            s_print(f"{DIVIDER}\n{CHANGE_LABEL} Order -- {side} {new_size} units @ {item.get('price')} "
+                    f"-- order_id = {order_id} -- timestamp: {timestamp}")
+
+        lob = self.lob
+        if lob is not None:
+
+            order = Order(
+                uid=order_id,
+                side=side,
+                price=None,
+                size=float(new_size),
+                timestamp=timestamp,
+            )
+
+            lob.process(order, Submit.Update)
+
+            if output_data:
+                self.output_data()
+
+    def __on_match(self, item: dict, output_data: bool) -> None:
+        """Process trades"""
+        self.__process_match(item)
+        if self.__process_candle is not None:
+            self.__process_candle(item)
+
     def output_data(self):
+        if self.output_queue is None:
+            return
+        # no point walking the book faster than the plotter can draw it
+        now = time.monotonic()
+        if now < self.__next_output:
+            return
         # Using try-except as in __end_output_data() results in latency climb
-        if self.output_queue is not None and self.output_queue.qsize() < self.output_queue._maxsize:
-            timestamp = datetime.strptime(self.lob.timestamp, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%m/%d/%Y-%H:%M:%S")
+        if self.output_queue.qsize() >= self.output_queue._maxsize:
+            self.__output_dropped += 1
+        else:
+            self.__next_output = now + self.output_interval
+            # reorder ISO 8601 fields (YYYY-MM-DDTHH:MM:SS.ffffffZ) into MM/DD/YYYY-HH:MM:SS without parsing
+            ts = self.lob.timestamp
+            timestamp = f"{ts[5:7]}/{ts[8:10]}/{ts[0:4]}-{ts[11:19]}"
 
             if hasattr(self, "traversal_perf"):
                 self.traversal_perf.timedelta()
 
-            bid_levels = self.lob.levels(Side.Bids)
-            ask_levels = self.lob.levels(Side.Asks)
+            if self.output_depth is None:
+                bid_levels = self.lob.levels(Side.Bids)
+                ask_levels = self.lob.levels(Side.Asks)
+            else:
+                bid_levels = self.lob.top_levels(Side.Bids, self.output_depth)
+                ask_levels = self.lob.top_levels(Side.Asks, self.output_depth)
 
             if hasattr(self, "traversal_perf"):
                 self.traversal_perf.timedelta(log=True)
@@ -679,7 +739,7 @@ class OrderbookBuilder:
             try:
                 self.output_queue.put(data, block=False)
             except q.Full:
-                pass
+                self.__output_dropped += 1
 
     def __end_output_data(self):
         if self.output_queue is not None:
@@ -724,6 +784,8 @@ class OrderbookBuilder:
         if self.lob is not None:
             print(self.lob.log_notes())
         logger.info(f"Matches processed = {self.matches.total_items:,}")
+        if self.output_queue is not None:
+            logger.info(f"Depth chart snapshots dropped while plotter was busy = {self.__output_dropped:,}")
         if self.candles is not None:
             logger.info(f"Candles generated = {self.candles.total_items}")
 
@@ -811,27 +873,39 @@ class OrderbookBuilder:
     def __save_dataframes(self, final: bool = False) -> None:
         if not (self.__save_matches or self.__save_candles):
             return
+        self.__next_save = time.monotonic() + self._save_interval
         logger.info(f"Saving dataframes. Time elapsed: {self.module_timer.elapsed(_format='hms')}")
 
-        if self.__save_matches and isinstance(self.matches, MatchDataFrame) and not self.matches.is_empty:
-            self.matches.save_chunk(csv=self.__save_matches, update_filename_flag=final)
-            if not self.__keep_matches_in_memory:
-                self.matches.clear()
-
-        if self.__save_candles and isinstance(self.candles, CandleDataFrame) and not self.candles.is_empty:
-            self.candles.save_chunk(csv=self.__save_matches, update_filename_flag=final)
-            if not self.__keep_candles_in_memory:
-                self.candles.clear()
-
-    @run_once_per_interval("_save_interval")
-    def __timed_save_dataframes(self, *args, **kwargs) -> None:
-        self.__save_dataframes(*args, **kwargs)
+        if self.__save_matches and isinstance(self.matches, MatchDataFrame):
+            if not self.matches.is_empty:
+                self.matches.save_chunk(csv=self.__save_matches)
+                if not self.__keep_matches_in_memory:
+                    self.matches.clear()
+            if final:
+                self.matches.finalize()
+
+        if self.__save_candles and isinstance(self.candles, CandleDataFrame):
+            if not self.candles.is_empty:
+                self.candles.save_chunk(csv=self.__save_candles)
+                if not self.__keep_candles_in_memory:
+                    self.candles.clear()
+            if final:
+                self.candles.finalize()
+
+    def __pending_rows(self) -> int:
+        rows = 0
+        if self.__save_matches:
+            rows += self.matches.pending_rows
+        if self.__save_candles and self.candles is not None:
+            rows += self.candles.pending_rows
+        return rows
 
     def __save(self, timed: bool = False, *args, **kwargs) -> None:
-        if timed:
-            self.__timed_save_dataframes(*args, **kwargs)
-        else:
-            self.__save_dataframes(*args, **kwargs)
+        if timed and time.monotonic() < self.__next_save:
+            # save early if rows pile up faster than the save interval
+            if self.__save_rows is None or self.__pending_rows() < self.__save_rows:
+                return
+        self.__save_dataframes(*args, **kwargs)
 
     @run_once_per_interval("_lob_check_interval")
     def __timed_lob_check(self) -> None:
@@ -854,25 +928,27 @@ class OrderbookBuilder:
 
         if track_average:
             self.__queue_stats["time"].append(self.__lob_builder_timer.elapsed())
-            self.__queue_stats["queue_sizes"].append(self.queue.qsize())
-            avg_qsize = sum(self.__queue_stats["queue_sizes"]) / len(self.__queue_stats["queue_sizes"])
+            queue_sizes, qsize = self.__queue_stats["queue_sizes"], self.queue.qsize()
+            if len(queue_sizes) == queue_sizes.maxlen:  # oldest size is about to be evicted
+                self.__qsize_sum -= queue_sizes[0]
+            queue_sizes.append(qsize)
+            self.__qsize_sum += qsize
+            avg_qsize = self.__qsize_sum / len(queue_sizes)
             logger.info(f"Average queue size over {self.__lob_builder_timer.elapsed(hms_format=True)}: {avg_qsize:.2f}")
             self.__queue_stats["avg_qsize"].append(avg_qsize)
-            # keep track of the last 1000 queue sizes (so 10k seconds)
-            self.__queue_stats["queue_sizes"] = self.__queue_stats["queue_sizes"][-1000:]
-            self.__queue_stats["avg_qsize"] = self.__queue_stats["avg_qsize"][-1000:]
 
         if track_delay and self.latest_timestamp is not None:
             delta = max(datetime.utcnow() - self.latest_timestamp, timedelta(0))
             logger.info(f"Script is {delta} seconds behind.")
             self.__queue_stats["delta"].append(delta)
-            self.__queue_stats["delta"] = self.__queue_stats["delta"][-1000:]  # limit to 1000 measurements
 
         if snapshot_mode:
             snapshot_orders = self.__snapshot_order_count - self.lob.items_processed
             msg += f"Snapshot orders left = {snapshot_orders}. "
 
         msg += f"Queue size = {self.queue.qsize()}."
+        if hasattr(self.queue, "high_water"):
+            msg += f" Max queue size = {self.queue.high_water}."
         logger.info(msg)
 
         delta = datetime.utcnow() - self.__last_timestamp
@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from tools.deque_queue import DequeQueue
+
+
+def test_put_get_fifo():
+    q = DequeQueue()
+    q.put({"sequence": 1})
+    q.put({"sequence": 2})
+    assert q.get() == {"sequence": 1}
+    assert q.get() == {"sequence": 2}
+    assert q.empty()
+
+
+def test_qsize_counts_msgs_in_batches():
+    q = DequeQueue()
+    batch = [{"sequence": 1}, {"sequence": 2}, {"sequence": 3}]
+    q.put(batch)
+    q.put({"sequence": 4})
+    assert q.qsize() == 4
+    assert q.get() is batch
+    assert q.qsize() == 1
+    q.get()
+    assert q.qsize() == 0
+
+
+def test_high_water_keeps_largest_qsize():
+    q = DequeQueue()
+    q.put([1, 2, 3])
+    q.put(4)
+    q.get()
+    q.get()
+    q.put(5)
+    assert q.qsize() == 1
+    assert q.high_water == 4
+
+
+def test_clear_resets_msg_count():
+    q = DequeQueue()
+    q.put([1, 2, 3])
+    q.put(None)
+    q.clear()
+    assert q.empty()
+    assert q.qsize() == 0
+    q.put([1, 2])
+    assert q.qsize() == 2
+
+
+def test_get_timeout_raises_empty():
+    q = DequeQueue()
+    start = time.monotonic()
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+
+
+def test_get_nowait_raises_empty():
+    q = DequeQueue()
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+
+
+def test_blocked_get_returns_item_put_by_another_thread():
+    q = DequeQueue()
+    threading.Timer(0.05, q.put, args=([1, 2],)).start()
+    assert q.get(timeout=5) == [1, 2]
+    assert q.qsize() == 0
+
+
+def test_wake_interrupts_blocked_get_without_enqueuing():
+    q = DequeQueue()
+    threading.Timer(0.05, q.wake).start()
+    start = time.monotonic()
+    with pytest.raises(queue.Empty):
+        q.get(timeout=5)
+    assert time.monotonic() - start < 5
+    assert q.qsize() == 0
+    assert q.empty()
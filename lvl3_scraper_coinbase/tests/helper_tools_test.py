@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import tools.helper_tools as helper_tools
+from tools.helper_tools import parse_timestamp
+
+
+def test_parse_timestamp_z_suffix_six_digit_fraction():
+    assert parse_timestamp("2022-09-27T19:31:30.869562Z") == datetime(2022, 9, 27, 19, 31, 30, 869562)
+
+
+def test_parse_timestamp_without_z_suffix():
+    assert parse_timestamp("2022-09-27T19:31:30.869562") == datetime(2022, 9, 27, 19, 31, 30, 869562)
+
+
+def test_parse_timestamp_short_fraction():
+    assert parse_timestamp("2022-09-27T19:31:30.86Z") == datetime(2022, 9, 27, 19, 31, 30, 860000)
+    assert parse_timestamp("2022-09-27T19:31:30.8695Z") == datetime(2022, 9, 27, 19, 31, 30, 869500)
+
+
+def test_parse_timestamp_no_fraction():
+    assert parse_timestamp("2022-09-27T19:31:30Z") == datetime(2022, 9, 27, 19, 31, 30)
+
+
+def test_parse_timestamp_returns_naive_datetime():
+    assert parse_timestamp("2022-09-27T19:31:30.869562Z").tzinfo is None
+
+
+def test_parse_timestamp_strptime_fallback(monkeypatch):
+    class NoIsoDatetime(datetime):
+        @classmethod
+        def fromisoformat(cls, date_string):
+            raise ValueError(date_string)
+
+    monkeypatch.setattr(helper_tools, "datetime", NoIsoDatetime)
+    assert parse_timestamp("2022-09-27T19:31:30.86Z") == datetime(2022, 9, 27, 19, 31, 30, 860000)
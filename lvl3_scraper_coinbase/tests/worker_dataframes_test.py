@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lvl3_scraper_coinbase.worker_dataframes import CandleDataFrame, MatchDataFrame, MatchRing
+
+TIMESTAMP = "20221201-123456"
+
+
+def make_match(trade_id, product_id="ETH-USD", side="buy", time="2022-12-01T12:34:56.789012Z"):
+    return {
+        "type": "match", "trade_id": trade_id, "maker_order_id": f"maker-{trade_id}",
+        "taker_order_id": f"taker-{trade_id}", "side": side, "size": "0.5", "price": "1275.12",
+        "product_id": product_id, "sequence": 1000 + trade_id, "time": time
+    }
+
+
+def test_candle_filename():
+    candles = CandleDataFrame(exchange="coinbase", frequency="1T", timestamp=TIMESTAMP)
+    candles.total_items = 12
+    candles.product_ids = {"BTC-USD": None, "ETH-USD": None}
+    candles.derive_df_filename()
+    assert candles.filename == "coinbase_12_1T_OHLC_candles_BTC,ETH_USD_20221201-123456"
+
+
+def test_match_filename():
+    matches = MatchDataFrame(exchange="coinbase", market="ETH-USD", timestamp=TIMESTAMP)
+    for trade_id in range(3):
+        matches.process_item(make_match(trade_id), display_match=False, store_in_df=True)
+    matches.derive_df_filename()
+    assert matches.filename == "coinbase_3_order_matches_ETH_USD_20221201-123456"
+
+
+def test_match_ring_to_frame_round_trip():
+    matches = MatchDataFrame(exchange="coinbase", market="ETH-USD", timestamp=TIMESTAMP)
+    ring = MatchRing(matches.columns, capacity=4)
+    items = [make_match(1, side="buy"), make_match(2, side="sell"), make_match(3, product_id="BTC-USD")]
+    for item in items:
+        assert not ring.push(item)
+    df = ring.to_frame()
+
+    assert len(ring) == 0
+    assert list(df.columns) == list(matches.columns)
+    assert isinstance(df["type"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["side"].dtype, pd.CategoricalDtype)
+    assert df["type"].tolist() == ["match"] * 3
+    assert df["side"].tolist() == ["buy", "sell", "buy"]
+    assert df["product_id"].tolist() == ["ETH-USD", "ETH-USD", "BTC-USD"]
+    assert df["trade_id"].dtype == np.int64
+    assert df["trade_id"].tolist() == [1, 2, 3]
+    assert df["size"].tolist() == [0.5] * 3
+    assert df["price"].tolist() == [1275.12] * 3
+    assert df["time"].iloc[0] == pd.Timestamp("2022-12-01 12:34:56.789012")
+    assert df["maker_order_id"].tolist() == ["maker-1", "maker-2", "maker-3"]
+
+
+def test_match_ring_reports_full():
+    ring = MatchRing(MatchDataFrame().columns, capacity=2)
+    assert not ring.push(make_match(1))
+    assert ring.push(make_match(2))
+
+
+@pytest.mark.parametrize("field, value", [("type", "last_match"), ("side", "short"), ("side", None)])
+def test_match_ring_rejects_uncategorized_values(field, value):
+    ring = MatchRing(MatchDataFrame().columns)
+    item = make_match(1)
+    item[field] = value
+    with pytest.raises(ValueError):
+        ring.push(item)
+    assert len(ring) == 0
+
+
+def test_match_ring_rejects_missing_trade_id():
+    ring = MatchRing(MatchDataFrame().columns)
+    item = make_match(1)
+    del item["trade_id"]
+    with pytest.raises(ValueError):
+        ring.push(item)
+    assert len(ring) == 0
@@ -1,4 +1,3 @@
-import json
 import gzip
 import threading
 import time
@@ -6,17 +5,19 @@ from pathlib import Path
 import multiprocessing as mp
 import queue
 from threading import Thread
-from websocket import create_connection, WebSocketConnectionClosedException
+from websockets.sync.client import connect
+from websockets.exceptions import ConnectionClosed
 from datetime import datetime, timedelta
 from collections import deque
 import numpy as np
+import orjson
 
 # third party modules
 from loguru import logger
 from api_coinbase import CoinbaseAPI
 
 # homebrew modules
-from tools.helper_tools import s_print
+from tools.helper_tools import s_print, parse_timestamp
 from tools.timer import Timer
 from tools.run_once_per_interval import run_once_per_interval, run_once
 from plotting.performance import PerfPlotQueueItem
@@ -43,20 +44,43 @@ class WebsocketClient:
     ) -> None:
         self.channel = kwargs.get("channel", None)
         self.market = kwargs.get("market", None)
+        # several markets can share one connection, rather than running a thread per market.
+        # OrderbookBuilder builds a single market's book and rejects a multi-market subscription
+        self.markets = list(kwargs.get("markets", None) or [self.market])
+        if self.market is None:
+            self.market = ','.join(self.markets)
         self.exchange = kwargs.get("exchange", None)
         self.data_queue = data_queue
         self.id = self.channel + '_' + self.market
         self.ws_url = kwargs.get("endpoint", None)
+        self.compression = kwargs.get("compression", "deflate")  # "deflate" or None
         self.user = api.get_user()
         self.save_feed = kwargs.get("save_feed", False)
         self.output_folder = kwargs.get("output_folder", "data")
         self.module_timer = module_timer
+        # built once here so reconnects just resend it
+        self.subscribe_payload = orjson.dumps(
+            {
+                "type": "subscribe",
+                "user_id": self.user["legacy_id"],
+                "profile_id": self.user["id"],
+                "product_ids": self.markets,
+                "channels": [self.channel]
+            }
+        ).decode()  # Coinbase expects a text frame
+
+        # msgs are put into data_queue as lists of up to batch_size msgs, held for at most batch_interval seconds
+        self.batch_size = kwargs.get("batch_size", 64)  # int
+        self.batch_interval = kwargs.get("batch_interval", 0.001)  # float (seconds)
+        self.__batch = []
+        self.__batch_deadline = 0.0
 
         self.ws = None
         self.thread = None
         self.thread_id = None
         self.running = None
         self.kill = False
+        self.done = threading.Event()  # set when the websocket thread exits, however it exits
 
         # performance monitoring
         self.latest_timestamp = None
@@ -66,20 +90,10 @@ class WebsocketClient:
             self.websocket_perf = PerfPlotQueueItem("websocket_thread", module_timer=module_timer)
 
     def websocket_thread(self) -> None:
-        self.ws = create_connection(self.ws_url)
+        # permessage-deflate is negotiated during the handshake, not in the subscribe message
+        self.ws = connect(self.ws_url, compression=self.compression, max_size=2**22, open_timeout=10)
         self.thread_id = threading.current_thread().ident
-        self.ws.send(
-            json.dumps(
-                {
-                    "type": "subscribe",
-                    "Sec-WebSocket-Extensions": "permessage-deflate",
-                    "user_id": self.user["legacy_id"],
-                    "profile_id": self.user["id"],
-                    "product_ids": [self.market],
-                    "channels": [self.channel]
-                }
-            )
-        )
+        self.ws.send(self.subscribe_payload)
 
         feed_filename = None
         if self.save_feed:
@@ -91,15 +105,31 @@ class WebsocketClient:
 
         self.running = True
 
+        # bind per-message lookups to locals once, outside the receive loop
+        recv, loads, process_msg = self.ws.recv, orjson.loads, self.process_msg
+        output_perf_data, flush_batch = self.__output_perf_data, self.flush_batch
+        main_thread, save_feed, monotonic = threading.main_thread(), self.save_feed, time.monotonic
+
         feed = None
-        while not self.kill and threading.main_thread().is_alive():
+        while not self.kill and main_thread.is_alive():
+
+            # don't hold a partial batch past its deadline waiting on the next frame
+            batch_timeout = None
+            if self.__batch:
+                batch_timeout = self.__batch_deadline - monotonic()
+                if batch_timeout <= 0:
+                    flush_batch()
+                    batch_timeout = None
 
             try:
-                feed = self.ws.recv()
+                feed = recv(timeout=batch_timeout)
                 if feed:
-                    msg = json.loads(feed)
+                    msg = loads(feed)
                 else:
                     msg = {}
+            except TimeoutError:
+                flush_batch()
+                continue
             except (ValueError, KeyboardInterrupt, Exception) as e:
                 # logger.debug(e)
                 logger.debug(f"{e} - data: {feed}")
@@ -107,15 +137,17 @@ class WebsocketClient:
             else:
                 if msg != {}:
 
-                    if self.save_feed:
-                        f.write(json.dumps(msg)+'\n')
+                    if save_feed:
+                        f.write(feed + '\n')  # frame is already json, no need to re-serialize msg
 
-                    self.process_msg(msg)
+                    process_msg(msg)
 
-                    self.__output_perf_data()
+                    output_perf_data()
 
                 else:
-                    logger.warning("Webhook message is empty!")
+                    self.__empty_msg_warning()
+
+        self.flush_batch()
 
         if self.save_feed:
             f.close()
@@ -128,7 +160,7 @@ class WebsocketClient:
         try:
             if self.ws:
                 self.ws.close()
-        except WebSocketConnectionClosedException:
+        except ConnectionClosed:
             pass
         logger.info(f"Closed websocket for {self.id}.")
 
@@ -139,6 +171,11 @@ class WebsocketClient:
         if self.stats_queue is not None:
             self.websocket_perf.send_to_queue(self.stats_queue)
 
+    @run_once_per_interval(60)
+    def __empty_msg_warning(self):
+        # empty frames can arrive back to back, one warning a minute is enough
+        logger.warning("Webhook message is empty!")
+
     @run_once
     def __end_perf_data(self):
         if self.stats_queue is not None:
@@ -149,18 +186,34 @@ class WebsocketClient:
     def process_msg(self, msg: dict):
         timestamp = msg.get("time")
         if timestamp is not None:
-            self.latest_timestamp = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ").timestamp()
+            self.latest_timestamp = parse_timestamp(timestamp).timestamp()
         else:
             self.latest_timestamp = datetime.utcnow().timestamp()
-        self.data_queue.put(msg)
+        if not self.__batch:
+            self.__batch_deadline = time.monotonic() + self.batch_interval
+        self.__batch.append(msg)
+        if len(self.__batch) >= self.batch_size or time.monotonic() >= self.__batch_deadline:
+            self.flush_batch()
         if hasattr(self, "websocket_perf"):
             self.websocket_perf.track(timestamp=self.latest_timestamp)
 
+    def flush_batch(self) -> None:
+        """Put pending msgs into data_queue as a single list item."""
+        if self.__batch:
+            self.data_queue.put(self.__batch)
+            self.__batch = []
+
     def start_thread(self) -> None:
         logger.info(f"Starting websocket thread for {self.id}....")
-        self.thread = Thread(target=self.websocket_thread)
+        self.thread = Thread(target=self.__run_websocket_thread)
         self.thread.start()
 
+    def __run_websocket_thread(self) -> None:
+        try:
+            self.websocket_thread()
+        finally:
+            self.done.set()
+
     def kill_thread(self) -> None:
         logger.info(f"Closing websocket thread for {self.id}...")
         self.kill = True
@@ -179,14 +232,17 @@ class WebsocketClient:
 
 class WebsocketClientHandler:
     def __init__(self) -> None:
-        self.websocket_clients = []
+        self.websocket_clients = {}  # keyed by websocket client id
         # self.active = []
         self.websocket_keepalive = Thread(target=self.websocket_thread_keepalive, daemon=True)
+        self.__keepalive_stop = threading.Event()
         self.kill_signal_sent = False
         self.start_signal_sent = False
+        self.__short_market_str = ''
 
     def add(self, websocket_client: WebsocketClient, start_immediately: bool = True) -> None:
-        self.websocket_clients.append(websocket_client)
+        self.websocket_clients[websocket_client.id] = websocket_client
+        self.__update_short_market_str()
         if start_immediately:
             self.start(websocket_client)
 
@@ -198,74 +254,65 @@ class WebsocketClientHandler:
             self.websocket_keepalive.start()
 
     def start_all(self) -> None:
-        s_print(f"Starting websocket threads for: {[x.id for x in self.websocket_clients]}")
-        for websocket_client in self.websocket_clients:
+        s_print(f"Starting websocket threads for: {list(self.websocket_clients)}")
+        for websocket_client in self.websocket_clients.values():
             self.start(websocket_client)
 
     def kill(self, websocket_client) -> None:
         websocket_client.kill_thread()
         self.kill_signal_sent = True
 
-    def kill_all(self) -> None:
+    def kill_all(self, timeout: float = 10) -> None:
         # logger.info(f"Killing all websocket threads...")
-        for websocket_client in self.websocket_clients:
+        self.__keepalive_stop.set()
+        for websocket_client in self.websocket_clients.values():
             self.kill(websocket_client)
-        time.sleep(1)
-        self.check_finished()
+        # all clients share one deadline, rather than each getting the full timeout in turn
+        deadline = time.monotonic() + timeout
+        for websocket_client in list(self.websocket_clients.values()):
+            if websocket_client.thread is not None:
+                if not websocket_client.done.wait(max(deadline - time.monotonic(), 0)):
+                    logger.warning(f"{websocket_client.id} is still running after {timeout} seconds.")
+                    continue
+            del self.websocket_clients[websocket_client.id]
+        self.__update_short_market_str()
+        logger.info(f"{len(self.websocket_clients)} websocket thread(s) remaining.")
 
     def all_threads_alive(self) -> bool:
-        for websocket_client in self.websocket_clients:
-            if not websocket_client.thread.is_alive():
-                return False
-        return True
-
-    def check_finished(self) -> None:
-        while len(self.get_active) != 0:
-            i = 0
-            while i < len(self.websocket_clients):
-                if not self.websocket_clients[i].running:
-                    # logger.debug(f"{self.websocket_clients[i].id} has stopped running.")
-                    self.websocket_clients.remove(self.websocket_clients[i])
-                    logger.info(f"{len(self.get_active)} websocket thread(s) remaining.")
-                else:
-                    logger.info(f"{self.websocket_clients[i].id} is still running.")
-                    i += 1
-
-            if len(self.get_active) != 0:
-                logger.info(f"Checking again in 5 seconds.")
-                time.sleep(5)
+        return not any(websocket_client.done.is_set() for websocket_client in self.websocket_clients.values())
 
     def websocket_thread_keepalive(self, interval=60) -> None:
-        time.sleep(interval//10)
+        self.__keepalive_stop.wait(interval//10)
 
         @run_once_per_interval(interval)
         def ping_all():
-            for websocket_client in self.websocket_clients:
+            for websocket_client in self.websocket_clients.values():
                 if websocket_client.running:
                     try:
                         websocket_client.ping("keepalive")
                         logger.info(f"Pinged websocket for {websocket_client.market}.")
-                    except WebSocketConnectionClosedException:
+                    except ConnectionClosed:
                         pass
 
-        while self.websockets_open:
+        while self.websockets_open and not self.__keepalive_stop.is_set():
             ping_all()
-            time.sleep(interval//10)
+            self.__keepalive_stop.wait(interval//10)
 
         logger.info(f"No websockets open. Ending keepalive thread...")
 
+    def __update_short_market_str(self) -> None:
+        # get market symbols and append into single string i.e. BTC,ETH,SOL
+        self.__short_market_str = ','.join(
+            market.partition("-")[0] for websocket in self.websocket_clients.values() for market in websocket.markets)
+
     @property
     def short_market_str(self) -> str:
-        # get market symbols and append into single string i.e. BTC,ETH,SOL
-        return ','.join([websocket.__market[:websocket.__market.find("-")] for websocket in self.websocket_clients])
+        return self.__short_market_str
 
     @property
     def websockets_open(self) -> bool:
-        if self.websocket_clients:
-            return True
-        else:
-            return False
+        return bool(self.websocket_clients)
 
     @property
     def get_active(self) -> list:
-        return [x.id for x in self.websocket_clients if x.thread.is_alive()]
+        return [x.id for x in self.websocket_clients.values() if x.thread.is_alive()]
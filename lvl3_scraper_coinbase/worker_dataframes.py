@@ -1,148 +1,213 @@
 import os
-import re
-from pathlib import Path
 from datetime import datetime
-from termcolor import colored
 
 from loguru import logger
 
-from tools.helper_tools import s_print
+from tools.helper_tools import s_print, colored
 
+import numpy as np
 import pandas as pd
-pd.set_option('display.max_rows', 500)
-pd.set_option('display.max_columns', 500)
-pd.set_option('display.width', 1000)
+
+
+def configure_display() -> None:
+    """Widen pandas' printing limits for inspecting dataframes. Not applied on import, call from interactive use."""
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 1000)
+
+
+# escape codes are taken from colored() once, so display_match doesn't call colored() for every match
+_COLOR_END = colored("|", "green").partition("|")[2]
+SIDE_COLORS = {side: colored("|", color).partition("|")[0] for side, color in (("buy", "green"), ("sell", "red"))}
+SIDE_LABELS = {side: f"{color}{side} {_COLOR_END}" for side, color in SIDE_COLORS.items()}  # side text never changes
 
 
 class WorkerDataFrame:
     def __init__(self, df_type: str, *args, **kwargs):
         self.df = pd.DataFrame()
+        self.columns = ()  # set by subclasses
+        self._frames = []  # pending chunks, concatenated into df in one go by _materialize
+        self._rows = []  # pending tuples from append_tuple, turned into a single chunk by _materialize
         self.df_type = df_type
         self.filename_args = None
         self.filename = None
         self.total_items = 0
         self.output_folder = kwargs.get("output_folder", "data")
+        self.buffer_size = kwargs.get("buffer_size", 1 << 20)  # int (bytes), output file write buffer
+        self._fh = None  # output file, kept open between saves
+        self._header = True
+        self._saved_rows = 0  # rows of df already written to the output file
+        self._saved_items = 0  # total_items as of the last save
+        self.product_ids = {}  # product ids stored so far, in order of appearance (dict used as an ordered set)
+        self.round_columns = {}  # column -> decimals, applied to each chunk when it is written rather than per row
 
     def clear(self) -> None:  # clear dataframe in-place
         self.df = self.df.iloc[0:0]
+        self._frames = []
+        self._rows = []
+        self._saved_rows = 0
 
     def append_tuple(self, data: tuple) -> None:  # append tuple
-        _, col = self.df.shape
+        col = len(self.columns)
         if col == len(data):
-            self.df.loc[len(self.df)] = data
+            self._rows.append(data)  # df.loc[len(df)] = data would reallocate df on every append
         else:
             raise ValueError(f"Length mismatch. There are {col} columns, but {len(data)} elements to append.")
         self.total_items += 1
 
-    def concat(self, data: pd.DataFrame) -> None:  # append dataframe
-        self.df = pd.concat([self.df, data])
-        self.total_items += 1
+    def _flush_rows(self) -> None:
+        """Turn pending tuples into one chunk, keeping them in order with concatenated frames."""
+        if self._rows:
+            self._frames.append(pd.DataFrame(self._rows, columns=self.columns))
+            self._rows = []
 
-    def save_chunk(self, csv: bool = True, update_filename_flag: bool = False) -> None:
-        """Save dataframe chunk using append."""
+    def _materialize(self) -> None:
+        """Concatenate pending chunks into df."""
+        self._flush_rows()
+        if not self._frames:
+            return
+        frames = self._frames if self.df.empty else [self.df, *self._frames]
+        self.df = pd.concat(frames, ignore_index=True)
+        self._frames = []
+
+    def save_chunk(self, csv: bool = True) -> None:
+        """Append rows added since the last save to the output file.
+        The file is kept open with a large buffer between saves, until finalize() is called."""
 
         if not csv:
             return
 
+        self._materialize()
+
         if self.total_items == 0:  # filename can't be derived if dataframe is empty
             logger.debug(f"{self.df_type} dataframe is empty. Skipping save...")
             return
 
-        file_exists = Path(f"{self.output_folder}/{self.filename}").is_file()
-
-        if self.filename is not None:
-            # logger.debug(f"data/{self.filename} exists: {file_exists}")
-
-            if not file_exists:
+        if self._fh is None:
+            file_exists = self.filename is not None and os.path.isfile(os.path.join(self.output_folder, self.filename))
+            if not file_exists:  # append with headers only if file doesn't exist yet.
                 logger.debug(f"{self.filename} doesn't exist. Creating new one...")
-                header = True
                 self.derive_df_filename()
-            else:
-                # logger.debug(f"OK... File exists. Header set to False.")
-                header = False
-
-        else:  # append with headers only if file doesn't exist yet.
-            # logger.debug(f"No filename generated for {self.df_type} dataframe yet.")
-            # logger.debug(f"Setting header to True and deriving new filename...")
-            header = True
-            self.derive_df_filename()
-
-        if csv:
-
-            if Path(f"{self.output_folder}/{self.filename}").suffix != '.csv':  # append extension if doesn't exist
-                self.filename += ".csv"
-
-            if update_filename_flag and file_exists:  # rename when update_filename_flag=True (should only trigger at end)
-                # logger.debug(f"update_filename_flag flag set to {update_filename_flag}. Running file rename steps...")
-                self.update_filename(extension='.csv')
-
-            self.df.to_csv(rf"{self.output_folder}/{self.filename}", index=False, mode='a', header=header)
-            logger.info(f"Saved {self.df_type} dataframe into {self.filename}.")
+                if not self.filename.endswith('.csv'):  # append extension if doesn't exist
+                    self.filename += ".csv"
+            self._header = not file_exists
+            self._fh = open(os.path.join(self.output_folder, self.filename), 'a', newline='', buffering=self.buffer_size)
+
+        # rows before _saved_rows were written by an earlier save (when the df is kept in memory)
+        chunk = self.df.iloc[self._saved_rows:]
+        if self.round_columns:
+            chunk = chunk.round(self.round_columns)
+        chunk.to_csv(self._fh, index=False, header=self._header)
+        self._header = False
+        self._saved_rows = len(self.df)
+        self._saved_items = self.total_items
+        logger.info(f"Saved {self.df_type} dataframe into {self.filename}.")
+
+    def finalize(self) -> None:
+        """Close the output file and rename it with the final row count. Call once, after the last save."""
+        if self._fh is None:  # nothing was saved
+            return
+        self._fh.close()
+        self._fh = None
+        self.update_filename(extension='.csv')
 
     def update_filename(self, extension: str) -> None:
         prev_filename = self.filename
         self.derive_df_filename()
         self.filename += extension
-        os.rename(f"{self.output_folder}/{prev_filename}", f"{self.output_folder}/{self.filename}")
+        if self.filename == prev_filename:  # row count unchanged since the file was created
+            return
+        # os.replace also overwrites an existing target on Windows, where os.rename raises
+        os.replace(os.path.join(self.output_folder, prev_filename), os.path.join(self.output_folder, self.filename))
         logger.info(f"Renamed file from {prev_filename} to {self.filename}...")
         # assert Path(f"data/{self.filename}").is_file()
 
     def derive_df_filename(self) -> None:
-
-        def kwarg_it(__template: str) -> list:
-            __template = re.sub(r"{", "{kwargs['", re.sub(r"}", "']}", __template))
-            __list = re.split("_(?={)|(?<=})_", __template)
-            return __list
-
-        def __evaluate_filename_args(**kwargs) -> str:
-            """
-            Evaluate kwargs into a single filename string.
-            Kwargs must include a 'template' kwarg.
-            All elements within the f-string that must be evaluated should also be included within kwargs.
-            Template elements can only be evaluated two levels deep.
-            """
-
-            template = kwargs["template"]
-            eval_arg = []
-            for arg in kwarg_it(template):
-
-                try:
-                    (arg,) = eval(arg)
-                except NameError:
-                    pass
-                finally:
-                    eval_arg.append(str(arg))
-
-                if any(x in arg for x in {'{', '}'}):  # if brackets still exist, evaluate one level deeper
-                    eval_sub_arg = []
-                    for sub_arg in kwarg_it(arg):
-
-                        try:
-                            (sub_arg,) = eval(sub_arg)
-                        except NameError:
-                            pass
-                        finally:
-                            eval_sub_arg.append(str(sub_arg))
-
-                    arg = '_'.join(eval_sub_arg)
-                    eval_arg[-1] = arg
-
-            return '_'.join(eval_arg)
-
-        self.filename = __evaluate_filename_args(**self.filename_args)
+        """
+        Fill filename_args["template"] in from the rest of filename_args.
+        Values can themselves be templates (e.g. filename_body), filled in from the same args one level deep.
+        """
+        args = {
+            key: value.format_map(self.filename_args) if isinstance(value, str) and key != "template" else value
+            for key, value in self.filename_args.items()
+        }
+        self.filename = self.filename_args["template"].format_map(args)
         # logger.debug(f"filename derived: {self.filename}")
 
     @property
     def is_empty(self) -> bool:
-        if self.df.empty:
-            return True
-        else:
-            return False
+        return self.df.empty and not self._frames and not self._rows
 
     @property
     def rows(self):
         return self.total_items
 
+    @property
+    def pending_rows(self) -> int:
+        """Items added since the last save."""
+        return self.total_items - self._saved_items
+
+
+class MatchRing:
+    """Preallocated column arrays that match items are written into, materialized into a DataFrame in bulk."""
+    dtypes = {
+        "type": object,
+        "time": "datetime64[us]",
+        "product_id": object,
+        "side": object,
+        "size": np.float64,
+        "price": np.float64,
+        "trade_id": np.int64,
+        "maker_order_id": object,
+        "taker_order_id": object,
+    }
+    # low cardinality string columns are stored as categoricals, one small code per row instead of an object
+    categories = {
+        "type": pd.CategoricalDtype(["match"]),
+        "side": pd.CategoricalDtype(["buy", "sell"]),
+    }
+
+    def __init__(self, columns: tuple, capacity: int = 65536):
+        self.capacity = capacity
+        self.idx = 0
+        self.arrays = {col: np.empty(capacity, dtype=self.dtypes.get(col, object)) for col in columns}
+        # (field, array) pairs copied as-is, resolved once instead of per push
+        self.__fields = tuple((col, arr) for col, arr in self.arrays.items() if col != "time")
+        self.__times = self.arrays["time"]
+        # values the categoricals can hold, and int columns that have no missing value, checked before a row is written
+        self.__allowed = tuple((col, frozenset(dtype.categories)) for col, dtype in self.categories.items() if col in columns)
+        self.__required = tuple(col for col in columns if self.dtypes.get(col) is np.int64)
+
+    def push(self, item: dict) -> bool:
+        """Write item into the next row. Returns True once the buffer is full.
+        Raises ValueError, without writing anything, if item doesn't fit the column types."""
+        i = self.idx
+        get = item.get
+        for col, allowed in self.__allowed:
+            if get(col) not in allowed:  # would silently become NaN in the categorical
+                raise ValueError(f"Invalid {col} {get(col)!r} in match: {item}")
+        for col in self.__required:
+            if get(col) is None:
+                raise ValueError(f"Missing {col} in match: {item}")
+        for col, arr in self.__fields:
+            arr[i] = get(col)
+        self.__times[i] = np.datetime64(item["time"].rstrip("Z"))  # numpy rejects tz suffixes
+        self.idx = i + 1
+        return self.idx == self.capacity
+
+    def to_frame(self) -> pd.DataFrame:
+        """Copy buffered rows into a new DataFrame and rewind the buffer."""
+        df = pd.DataFrame({
+            col: pd.Categorical(arr[:self.idx], dtype=self.categories[col]) if col in self.categories
+            else arr[:self.idx].copy()
+            for col, arr in self.arrays.items()
+        })
+        self.idx = 0
+        return df
+
+    def __len__(self) -> int:
+        return self.idx
+
 
 class MatchDataFrame(WorkerDataFrame):
     def __init__(self, *args, **kwargs):
@@ -153,22 +218,28 @@ class MatchDataFrame(WorkerDataFrame):
         self.columns = (
             "type", "time", "product_id", "side", "size", "price", "trade_id", "maker_order_id", "taker_order_id"
         )
-        self.df = pd.DataFrame(columns=self.columns)
         self.filename = None
+        self.ring = MatchRing(self.columns)
+        self.df = self.ring.to_frame()  # empty, but already typed like the chunks appended to it
 
     def process_item(self, item, display_match=True, store_in_df=False) -> None:
         if display_match:
             self.display_match(item)
         if store_in_df:
-            item = self.convert_to_df(item)
-            self.concat(item)
-
-    def convert_to_df(self, item) -> pd.DataFrame():
-        """Converts passed item from dict to DataFrame"""
-        item = {key: value for key, value in item.items() if key in self.columns}
-        item["time"] = datetime.strptime(item.get('time'), "%Y-%m-%dT%H:%M:%S.%fZ")
-        df = pd.DataFrame(columns=item.keys(), data=[item])
-        return df
+            if self.ring.push(item):
+                self._frames.append(self.ring.to_frame())
+            self.product_ids[item["product_id"]] = None  # after push, which rejects invalid items
+            self.total_items += 1
+
+    def flush(self) -> None:
+        """Move buffered matches from the ring into the dataframe."""
+        if len(self.ring) != 0:
+            self._frames.append(self.ring.to_frame())
+        self._materialize()
+
+    def save_chunk(self, *args, **kwargs) -> None:
+        self.flush()
+        super().save_chunk(*args, **kwargs)
 
     def derive_df_filename(self) -> None:
         try:
@@ -186,10 +257,14 @@ class MatchDataFrame(WorkerDataFrame):
         else:
             super().derive_df_filename()
 
+    @property
+    def is_empty(self) -> bool:
+        return super().is_empty and len(self.ring) == 0
+
     @property
     def short_str(self):
         if self.market is None:
-            short_str = ','.join([x[:x.find("-")] for x in list(self.df.loc[:, "product_id"].unique())])
+            short_str = ','.join(x[:x.find("-")] for x in self.product_ids)
         else:
             short_str = self.market[:self.market.find("-")]
         return short_str
@@ -199,20 +274,21 @@ class MatchDataFrame(WorkerDataFrame):
 
         # build text
         line_output_1 = f"{item['time']} --- "
-        line_output_2 = f"{item['side']} "
-        line_output_3 = f"{item['size']} {item['product_id']} at ${float(item['price']):,}"
+        price = float(item['price'])
+        line_output_3 = f"{item['size']} {item['product_id']} at ${price:,}"
 
         # calc volume
-        usd_volume = float(item['size']) * float(item['price'])
+        usd_volume = float(item['size']) * price
         line_output_right = f"${usd_volume:,.2f}"
 
         # handle colors
-        if item["side"] == "buy":
-            line_output_2 = colored(line_output_2, "green")
-            line_output_right = colored(line_output_right, "green")
-        elif item["side"] == "sell":
-            line_output_2 = colored(line_output_2, "red")
-            line_output_right = colored(line_output_right, "red")
+        side = item["side"]
+        color = SIDE_COLORS.get(side)
+        if color is not None:
+            line_output_2 = SIDE_LABELS[side]
+            line_output_right = f"{color}{line_output_right}{_COLOR_END}"
+        else:
+            line_output_2 = f"{side} "
 
         # alignment
         line_output_left = line_output_1 + line_output_2 + line_output_3
@@ -221,63 +297,72 @@ class MatchDataFrame(WorkerDataFrame):
         s_print(line_output)
 
 
+class OpenCandle:
+    """OHLCV of a candle that is still being built."""
+    __slots__ = ("candle_ns", "open", "high", "low", "close", "volume")
+
+    def __init__(self, candle_ns: int, price: float, size: float):
+        self.candle_ns = candle_ns
+        self.open = self.high = self.low = self.close = price
+        self.volume = size
+
+
 class CandleDataFrame(WorkerDataFrame):
     def __init__(self, *args, **kwargs):
         super(CandleDataFrame, self).__init__(df_type="candles", *args, **kwargs)
         self.exchange = kwargs.get("exchange", None)
         self.market = kwargs.get("market", None)
         self.frequency = kwargs.get("frequency", None)
+        # fixed frequencies (1T, 5T, 1H...) are floored with integer math on ns timestamps, others go through pandas
+        try:
+            self.freq_ns = pd.Timedelta(self.frequency).value if self.frequency is not None else None
+        except ValueError:
+            self.freq_ns = None
         self.timestamp = kwargs.get("timestamp", datetime.now().strftime("%Y%m%d-%H%M%S"))
         self.columns = (
             "type", "candle", "product_id", "frequency", "open", "high", "low", "close", "volume"
         )
-        self.df = pd.DataFrame(columns=self.columns)
-        # temp variables to help with building current candle
-        self.last_candle = None
-        self.last_open = None
-        self.last_high = None
-        self.last_low = None
-        self.last_close = None
-        self.last_volume = None
-
-    def convert_to_df(self, item) -> pd.DataFrame():
-        item["time"] = datetime.strptime(item.get('time'), "%Y-%m-%dT%H:%M:%S.%fZ")
-        df = pd.DataFrame(columns=item.keys(), data=[item])
-        return df
+        # typed up front so the empty frame matches the chunks appended to it
+        self.df = pd.DataFrame(columns=self.columns).astype(
+            {"candle": "datetime64[ns]", **{col: np.float64 for col in ("open", "high", "low", "close", "volume")}}
+        )
+        self.round_columns = {"volume": 6}
+        # candle currently being built for each product, so markets sharing one feed don't mix
+        self.open_candles = {}  # product_id -> OpenCandle
 
     def process_item(self, item) -> None:
-        item = self.convert_to_df(item)  # convert from dict into df to leverage pandas dt.floor method
-        __candle = item["time"].dt.floor(freq=self.frequency)[0]  # floor time at chosen frequency
-        __product_id = item["product_id"][0]
-        __size = float(item["size"][0])
-        __price = float(item["price"][0])
-
-        if self.last_candle is None:  # first candle
-            self.last_open = __price
-            self.last_high = __price
-            self.last_low = __price
-            self.last_close = __price
-            self.last_volume = __size
-        elif __candle != self.last_candle:
-            # if new candle, append candle vars to df and reset vars for new candle
+        freq_ns, open_candles = self.freq_ns, self.open_candles
+
+        # floor time at chosen frequency
+        if freq_ns is not None:
+            __ns = int(np.datetime64(item["time"].rstrip("Z"), "ns").astype(np.int64))
+            __candle_ns = __ns - __ns % freq_ns
+        else:
+            __candle_ns = pd.Timestamp(item["time"].rstrip("Z")).floor(freq=self.frequency).value
+        __product_id = item["product_id"]
+        __size = float(item["size"])
+        __price = float(item["price"])
+
+        __candle = open_candles.get(__product_id)
+        if __candle is None:  # first candle
+            open_candles[__product_id] = OpenCandle(__candle_ns, __price, __size)
+        elif __candle_ns != __candle.candle_ns:
+            # if new candle, append candle vars to df and start a new candle
             __tuple = (
-                "candles", self.last_candle, __product_id, self.frequency, self.last_open,
-                self.last_high, self.last_low, self.last_close, round(self.last_volume, 6)
+                "candles", pd.Timestamp(__candle.candle_ns), __product_id, self.frequency, __candle.open,
+                __candle.high, __candle.low, __candle.close, __candle.volume
             )
             # logger.debug(f"appending tuple to candles df: {__tuple}")
             self.append_tuple(__tuple)
-            self.last_open = __price
-            self.last_high = __price
-            self.last_low = __price
-            self.last_close = __price
-            self.last_volume = __size
+            self.product_ids[__product_id] = None
+            open_candles[__product_id] = OpenCandle(__candle_ns, __price, __size)
         else:  # if same candle, continue building it up
-            self.last_high = max(self.last_high, __price)
-            self.last_low = min(self.last_low, __price)
-            self.last_close = __price
-            self.last_volume += __size
-
-        self.last_candle = __candle
+            if __price > __candle.high:
+                __candle.high = __price
+            elif __price < __candle.low:
+                __candle.low = __price
+            __candle.close = __price
+            __candle.volume += __size
 
     def derive_df_filename(self) -> None:
         try:
@@ -299,7 +384,7 @@ class CandleDataFrame(WorkerDataFrame):
     @property
     def short_str(self):
         if self.market is None:
-            short_str = ','.join([x[:x.find("-")] for x in list(self.df.loc[:, "product_id"].unique())])
+            short_str = ','.join(x[:x.find("-")] for x in self.product_ids)
         else:
             short_str = self.market[:self.market.find("-")]
         return short_str
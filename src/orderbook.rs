@@ -150,17 +150,25 @@ impl LimitOrderbook {
     /// order size (aggregate order size at each level)
     /// and cumulative depth (integral of price * order size)
     fn levels(&self, side: Side) -> Vec<(f64, f64, f64)> {
+        self.top_levels(side, usize::MAX)
+    }
+
+    /// Same as levels, but stops after the n levels closest to the best bid/ask
+    /// instead of walking the whole tree
+    fn top_levels(&self, side: Side, n: usize) -> Vec<(f64, f64, f64)> {
         match side {
             Side::Bids => {
-                self.bids.iter().rev().scan(0.0, |cumsum, node| Option::from({
-                    *cumsum += node.key * node.value.size();
-                    (node.key, node.value.size(), cumsum.clone())
+                self.bids.iter().rev().take(n).scan(0.0, |cumsum, node| Option::from({
+                    let size = node.value.size();
+                    *cumsum += node.key * size;
+                    (node.key, size, cumsum.clone())
                 })).collect()
             },
             Side::Asks => {
-                self.asks.iter().scan(0.0, |cumsum, node| Option::from({
-                    *cumsum += node.key * node.value.size();
-                    (node.key, node.value.size(), cumsum.clone())
+                self.asks.iter().take(n).scan(0.0, |cumsum, node| Option::from({
+                    let size = node.value.size();
+                    *cumsum += node.key * size;
+                    (node.key, size, cumsum.clone())
                 })).collect()
                 // println!("rust ask levels \n {:?}", result);
                 // result
@@ -1,20 +1,34 @@
 import signal
+import threading
 from loguru import logger
 import sys
 
 
 class GracefulKiller:
     """Help kill threads when stop called."""
-    kill_now = False
 
     def __init__(self, log_exit: bool = True):
         self.log_exit = log_exit
+        self.event = threading.Event()  # set once a stop is requested, so loops can wait on it instead of sleeping
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
         if sys.platform == 'win32':
             signal.signal(signal.SIGBREAK, self.exit_gracefully)
 
+    @property
+    def kill_now(self) -> bool:
+        return self.event.is_set()
+
+    @kill_now.setter
+    def kill_now(self, value: bool) -> None:
+        if value:
+            self.event.set()
+        else:
+            self.event.clear()
+
     def exit_gracefully(self, *args):
-        self.kill_now = True
+        # Event.set() takes a non-reentrant lock that the interrupted main thread may be holding
+        # inside event.wait(), so set it from a helper thread rather than from the signal handler
+        threading.Thread(target=self.event.set, daemon=True).start()
         if self.log_exit:
-            logger.critical(f"Stop signal sent. kill_now = {self.kill_now}")
+            logger.critical(f"Stop signal sent.")
@@ -0,0 +1,86 @@
+import time
+import queue
+import threading
+from collections import deque
+
+
+class DequeQueue(object):
+    """ An unbounded FIFO queue for many producer threads and a single consumer thread.
+    Unlike queue.Queue there is no Condition to notify on every put() and get(), only a
+    plain Lock that keeps the deque and its msg count in step. A threading.Event is only
+    touched to wake the consumer once the deque has run dry.
+    Items may be single msgs or lists of msgs (batches). qsize() and high_water count
+    msgs, not items, so backlog numbers mean the same thing whether or not producers batch.
+    Mirrors the parts of the queue.Queue interface used by this project, including
+    the underlying .queue attribute. Use clear() rather than .queue.clear(), so the msg count is reset too.
+    """
+
+    def __init__(self):
+        self.queue = deque()
+        self.__not_empty = threading.Event()
+        self.__woken = False  # set by wake(), makes a blocked get() raise queue.Empty early
+        self.__lock = threading.Lock()  # keeps queue and __msgs in step, taken once per item (batch), not per msg
+        self.__msgs = 0  # msgs currently queued, lists count as len(item)
+        self.high_water = 0  # largest qsize seen, so backlog growth is observable without dropping items
+
+    @staticmethod
+    def __msg_count(item) -> int:
+        return len(item) if isinstance(item, list) else 1
+
+    def put(self, item, block=True, timeout=None):
+        """ Append item. Never blocks, block and timeout are accepted for queue.Queue compatibility. """
+        with self.__lock:
+            self.queue.append(item)
+            self.__msgs += self.__msg_count(item)
+            if self.__msgs > self.high_water:
+                self.high_water = self.__msgs
+        self.__not_empty.set()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """ Pop the oldest item, waiting up to timeout seconds (forever if None). Raises queue.Empty. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.__lock:
+                if self.queue:
+                    item = self.queue.popleft()
+                    self.__msgs -= self.__msg_count(item)
+                    return item
+            if not block:
+                raise queue.Empty
+
+            self.__not_empty.clear()
+            if self.queue:  # item was appended before the clear
+                continue
+            if self.__woken:
+                self.__woken = False
+                raise queue.Empty
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            if not self.__not_empty.wait(remaining) and not self.queue:
+                raise queue.Empty
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def wake(self):
+        """ Make a get() that is blocked on an empty queue raise queue.Empty now, without enqueuing anything. """
+        self.__woken = True
+        self.__not_empty.set()
+
+    def clear(self):
+        """ Drop all queued items. """
+        with self.__lock:
+            self.queue.clear()
+            self.__msgs = 0
+
+    def qsize(self):
+        """ Number of msgs queued, counting each msg in a list item. """
+        return self.__msgs
+
+    def empty(self):
+        return not self.queue
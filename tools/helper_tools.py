@@ -1,12 +1,23 @@
+import sys
 import json
+import atexit
 import threading
+from queue import SimpleQueue
+from datetime import datetime
 
 from loguru import logger
 from urllib import parse
-from threading import Lock
+from threading import Lock, Thread, Event
 
 from tools.run_once_per_interval import run_once_per_interval
 
+# colour codes are only worth writing to a terminal, not to a redirected log or container stdout
+if sys.stdout.isatty():
+    from termcolor import colored
+else:
+    def colored(text, *args, **kwargs) -> str:
+        return str(text)
+
 
 def save_json(filename, d):
     """Save d into json file."""
@@ -28,11 +39,78 @@ def url_fix(s, charset='UTF-8'):
     qs = parse.quote_plus(qs, ':&=')
     return parse.urlunsplit((scheme, netloc, path, qs, anchor))
 
-def s_print(*a, **b):
-    """Thread-safe print function."""
-    s_print_lock = Lock()
-    with s_print_lock:
-        print(*a, **b)
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parse a Coinbase ISO timestamp e.g. 2022-12-01T12:34:56.789012Z into a naive utc datetime.
+    fromisoformat is implemented in C and is much faster than strptime, which is kept
+    as a fallback for fractions that fromisoformat won't take (it needs 3 or 6 digits before 3.11).
+    """
+    try:
+        return datetime.fromisoformat(timestamp[:-1] if timestamp[-1:] == "Z" else timestamp)
+    except ValueError:
+        return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class AsyncPrinter:
+    """Single writer thread for console output. Callers only put lines on a SimpleQueue, so printing never blocks them."""
+    def __init__(self):
+        self.q = SimpleQueue()
+        self.__lock = Lock()
+        self.thread = None
+
+    def write(self, s: str) -> None:
+        if self.thread is None:
+            self.__start()
+        self.q.put(s)
+
+    def flush(self, timeout: float = 1) -> None:
+        """Block until everything written so far is on stdout."""
+        if self.thread is not None and self.thread.is_alive():
+            done = Event()
+            self.q.put(done)  # writer thread sets it once it gets there, so order is preserved
+            done.wait(timeout)
+        else:
+            while not self.q.empty():
+                s = self.q.get_nowait()
+                if not isinstance(s, Event):
+                    sys.stdout.write(s)
+            sys.stdout.flush()
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.__drain, name="AsyncPrinter", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def __drain(self) -> None:
+        # block for the first line, then take whatever else is queued and write it in one call
+        while True:
+            pending = [self.q.get()]
+            while not self.q.empty() and len(pending) < 1024:
+                pending.append(self.q.get_nowait())
+            lines = []
+            for s in pending:
+                if isinstance(s, Event):
+                    sys.stdout.write(''.join(lines))
+                    lines.clear()
+                    sys.stdout.flush()
+                    s.set()
+                else:
+                    lines.append(s)
+            if lines:
+                sys.stdout.write(''.join(lines))
+
+
+_printer = AsyncPrinter()
+
+
+def s_print(*a, sep=' ', end='\n', **b):
+    """Thread-safe print function. Output is written by a dedicated printer thread, in call order."""
+    if b:  # file/flush kwargs bypass the printer
+        _printer.flush()
+        print(*a, sep=sep, end=end, **b)
+    else:
+        _printer.write(sep.join(map(str, a)) + end)
 
 def class_user_interface(class_instance):
     """Prints list of class instance's callable methods, prompts for input, and calls the chosen method"""
@@ -1,4 +1,4 @@
-from tools.timer import Timer
+import time
 
 
 def run_once(func):
@@ -15,26 +15,21 @@ def run_once_per_interval(interval_attribute):
     """Decorator that lets a function run at most once every interval of time."""
     def decorator(method):
         def wrapper(*args, **kwargs):
+            # skipped calls (the common case on hot paths) only cost a clock read and a compare
+            now = time.monotonic()
+            if now < wrapper.next_run:
+                return None
             # if passed param is string, pull instance attribute
             if isinstance(interval_attribute, str):
-                self = args[0]
-                interval = getattr(self, interval_attribute)
-                msg = f"interval {interval} is type {type(interval)}"
-                assert isinstance(interval, (int, float)), msg
+                interval = getattr(args[0], interval_attribute)
             # otherwise, assume it's an integer and use as-is
             else:
-                msg = f"interval {interval_attribute} is type {type(interval_attribute)}"
-                assert isinstance(interval_attribute, (int, float)), msg
                 interval = interval_attribute
-            # if first call, start timer and run function
-            if wrapper.timer.get_start_time() is None:
-                wrapper.timer.start()
-                return method(*args, **kwargs)
-            # for subsequent, check timer and run function if interval of time has passed
-            elif wrapper.timer.elapsed() > interval:
-                wrapper.timer.reset()
-                return method(*args, **kwargs)
-        wrapper.timer = Timer()
+            if not isinstance(interval, (int, float)):
+                raise TypeError(f"interval {interval} is type {type(interval)}")
+            wrapper.next_run = now + interval
+            return method(*args, **kwargs)
+        wrapper.next_run = float("-inf")  # first call always runs
         return wrapper
     return decorator
 